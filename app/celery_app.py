@@ -6,3 +6,11 @@ celery_app = Celery(
     broker=os.getenv("CELERY_BROKER_URL"),
     backend=os.getenv("CELERY_RESULT_BACKEND")
 )
+
+
+# Reuse broker connections across publishes instead of reconnecting under bursts
+celery_app.conf.update(
+    broker_pool_limit=int(os.getenv("CELERY_BROKER_POOL_LIMIT", "50")),
+    # Results live in the app's tasks table; don't store them again in the backend
+    task_ignore_result=True,
+)
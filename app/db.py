@@ -1,36 +1,93 @@
 import os
-from sqlalchemy import create_engine, Table, Column, String, Integer, MetaData, DateTime, Text
-from sqlalchemy.sql import insert, select, update
-from datetime import datetime
+import uuid
+from sqlalchemy import create_engine, Table, Column, String, BigInteger, Boolean, MetaData, DateTime, Text, Index, false, func
+from sqlalchemy.sql import select, update, bindparam, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import create_async_engine
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL environment variable not set")
 
 
-engine = create_engine(DATABASE_URL)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "20"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+# Pin the driver explicitly; newer SQLAlchemy maps plain postgresql:// to psycopg 3
+engine = create_engine(
+    make_url(DATABASE_URL).set(drivername="postgresql+psycopg2"),
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=30,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=True,  # drop connections killed by a DB restart instead of failing the request
+)
+
+# The API talks to Postgres through asyncpg; Celery workers keep the sync engine above
+async_engine = create_async_engine(
+    make_url(DATABASE_URL).set(drivername="postgresql+asyncpg"),
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=30,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=True,
+)
 metadata = MetaData()
 
 tasks_table = Table(
     "tasks", metadata,
-    Column("task_id", String, primary_key=True),
+    Column("task_id", postgresql.UUID(as_uuid=True), primary_key=True),
     Column("status", String, default="pending"),  # pending, completed, failed
-    Column("result", Integer, nullable=True),
+    Column("result", BigInteger, nullable=True),
     Column("error_message", Text, nullable=True),
-    Column("created_at", DateTime, default=datetime.utcnow),
-    Column("completed_at", DateTime, nullable=True),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+    Column("completed_at", DateTime(timezone=True), nullable=True),
+    # Set once the task has been published to Celery; lets idempotent retries re-publish
+    Column("dispatched", Boolean, nullable=False, server_default=false()),
+    # Task rows are ephemeral status records, so skip WAL; the table is truncated after a crash
+    prefixes=["UNLOGGED"],
 )
 
-metadata.create_all(engine)
+# Oldest-first scans of pending tasks (stuck-task checks, cleanup); only pending rows are indexed
+Index("ix_tasks_pending", tasks_table.c.created_at, postgresql_where=tasks_table.c.status == "pending")
 
-def create_task(task_id: str):
-    """Create a new task with pending status"""
-    with engine.begin() as conn:
-        conn.execute(insert(tasks_table).values(
-            task_id=task_id,
-            status="pending",
-            created_at=datetime.utcnow()
-        ))
+# Serialize schema creation: several uvicorn workers and the Celery worker import this at once
+with engine.begin() as conn:
+    conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('tasks_schema'))"))
+    metadata.create_all(conn)
+
+# Built once at import so the hot /results path only binds the task id
+_get_task_stmt = select(tasks_table).where(tasks_table.c.task_id == bindparam("tid"))
+
+# Returned by inserts so callers get the stored row without a follow-up select
+_created_columns = (tasks_table.c.task_id, tasks_table.c.status, tasks_table.c.created_at)
+
+async def bulk_create_tasks(task_ids: list[uuid.UUID]):
+    """
+    Create many pending tasks with a single executemany insert and return their
+    initial state. Ids that already exist are skipped and left out of the result.
+    """
+    if not task_ids:
+        return []
+    stmt = pg_insert(tasks_table).on_conflict_do_nothing(index_elements=["task_id"])
+    async with async_engine.begin() as conn:
+        res = await conn.execute(stmt.returning(*_created_columns), [
+            {"task_id": task_id, "status": "pending"}
+            for task_id in task_ids
+        ])
+        return res.mappings().all()
+
+async def mark_tasks_dispatched(task_ids: list[uuid.UUID]):
+    """Record that these tasks were published to Celery"""
+    if not task_ids:
+        return
+    async with async_engine.begin() as conn:
+        await conn.execute(update(tasks_table)
+                          .where(tasks_table.c.task_id.in_(task_ids))
+                          .values(dispatched=True))
 
 def save_result(task_id: str, result: int):
     """Save the result and mark task as completed"""
@@ -40,9 +97,22 @@ def save_result(task_id: str, result: int):
                     .values(
                         result=result,
                         status="completed",
-                        completed_at=datetime.utcnow()
+                        completed_at=func.now()
                     ))
 
+def bulk_save_results(rows: list[tuple]):
+    """Save many (task_id, result) pairs and mark them completed in one transaction"""
+    if not rows:
+        return
+    with engine.begin() as conn:
+        conn.execute(update(tasks_table)
+                    .where(tasks_table.c.task_id == bindparam("tid"))
+                    .values(
+                        result=bindparam("res"),
+                        status="completed",
+                        completed_at=func.now()
+                    ), [{"tid": task_id, "res": result} for task_id, result in rows])
+
 def mark_task_failed(task_id: str, error_message: str):
     """Mark a task as failed with error message"""
     with engine.begin() as conn:
@@ -51,11 +121,11 @@ def mark_task_failed(task_id: str, error_message: str):
                     .values(
                         status="failed",
                         error_message=error_message,
-                        completed_at=datetime.utcnow()
+                        completed_at=func.now()
                     ))
 
-def get_task(task_id: str):
-    """Get task details by task_id"""
-    with engine.begin() as conn:
-        res = conn.execute(select(tasks_table).where(tasks_table.c.task_id == task_id)).fetchone()
-        return dict(res) if res else None
+async def get_task(task_id: uuid.UUID):
+    """Get task details by task_id as a read-only mapping"""
+    async with async_engine.begin() as conn:
+        res = await conn.execute(_get_task_stmt, {"tid": task_id})
+        return res.mappings().first()
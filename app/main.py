@@ -1,18 +1,110 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import Body, FastAPI, HTTPException
+from fastapi.responses import Response
 from pydantic import BaseModel
+from cachetools import TTLCache
+from contextlib import asynccontextmanager
+from datetime import datetime
+import asyncio
+import logging
+import os
 import uuid
 from typing import Optional
-from .db import create_task, get_task
+from .celery_app import celery_app
+from .db import async_engine, bulk_create_tasks, get_task, mark_tasks_dispatched
 from .tasks import heavy_computation_task
 
-app = FastAPI(title="Async Task Processor API", version="1.0.0")
+logger = logging.getLogger(__name__)
 
-class TaskData(BaseModel):
-    data: Optional[dict] = None
+# How long the writer waits for more /process calls before handling a batch
+TASK_BATCH_WINDOW = float(os.getenv("TASK_BATCH_WINDOW_MS", "5")) / 1000
+TASK_BATCH_MAX = 500
 
+_task_queue: asyncio.Queue = asyncio.Queue()
+
+# Completed rows never change again, so repeated polls for them skip the database.
+# Failed rows are not cached: Celery retries the task and it may still complete.
+_completed_tasks = TTLCache(maxsize=10_000, ttl=300)
+
+def _dispatch_batch(batch, published):
+    """Publish a batch of tasks through one pooled broker producer, recording each one sent"""
+    with celery_app.producer_or_acquire() as producer:
+        for task_id, data, _ in batch:
+            heavy_computation_task.apply_async((task_id.hex, data), producer=producer)
+            published.add(task_id)
+
+async def _task_writer():
+    """
+    Drain queued tasks, insert them with one transaction per batch and
+    publish them to Celery. Each queued future is resolved with the
+    inserted row once its task is committed and dispatched, or with None
+    if the task id already existed.
+    """
+    while True:
+        batch = [await _task_queue.get()]
+        await asyncio.sleep(TASK_BATCH_WINDOW)
+        while len(batch) < TASK_BATCH_MAX and not _task_queue.empty():
+            batch.append(_task_queue.get_nowait())
+
+        try:
+            rows = await bulk_create_tasks(list(dict.fromkeys(task_id for task_id, _, _ in batch)))
+        except Exception as exc:
+            for _, _, queued in batch:
+                if not queued.done():
+                    queued.set_exception(exc)
+            continue
+
+        created = {row['task_id']: row for row in rows}
+        # Only dispatch tasks this batch actually inserted, once each
+        new_tasks, seen = [], set()
+        for item in batch:
+            if item[0] in created and item[0] not in seen:
+                seen.add(item[0])
+                new_tasks.append(item)
+
+        published = set()
+        unpublished, dispatch_error = set(), None
+        try:
+            await asyncio.to_thread(_dispatch_batch, new_tasks, published)
+        except Exception as exc:
+            # Unpublished rows stay pending with dispatched=false; a retry with the
+            # same task_id re-publishes them
+            dispatch_error = exc
+            unpublished = seen - published
+        await _record_dispatched(published)
+
+        for task_id, _, queued in batch:
+            if queued.done():
+                continue
+            if task_id in unpublished:
+                queued.set_exception(dispatch_error)
+            else:
+                queued.set_result(created.pop(task_id, None))
+
+async def _record_dispatched(task_ids):
+    """Flag published tasks; if this fails a retry may publish them again, which is harmless"""
+    try:
+        await mark_tasks_dispatched(list(task_ids))
+    except Exception:
+        logger.exception("Could not mark %d tasks as dispatched", len(task_ids))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    writer = asyncio.create_task(_task_writer())
+    yield
+    writer.cancel()
+    await async_engine.dispose()
+
+app = FastAPI(
+    title="Async Task Processor API",
+    version="1.0.0",
+    lifespan=lifespan,
+)
+
+# Declared return types let FastAPI serialize responses directly through Pydantic
 class TaskResponse(BaseModel):
     task_id: str
     status: str
+    created_at: Optional[datetime] = None
     message: str
 
 class TaskStatusResponse(BaseModel):
@@ -20,48 +112,77 @@ class TaskStatusResponse(BaseModel):
     status: str
     result: Optional[int] = None
     error_message: Optional[str] = None
-    created_at: Optional[str] = None
-    completed_at: Optional[str] = None
+    created_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+
+_HEALTH_OK = b'{"status":"ok"}'
 
 @app.get('/health')
-def health_check():
-    return {"status": "ok"}
+async def health_check():
+    # Constant pre-encoded body; async so the check skips the threadpool hop
+    return Response(_HEALTH_OK, media_type="application/json")
 
 @app.post("/process", response_model=TaskResponse)
-def process_task(task_data: TaskData = TaskData()):
+async def process_task(
+    data: Optional[dict] = Body(default=None, embed=True),
+    task_id: Optional[uuid.UUID] = Body(default=None, embed=True),
+):
     """
     Non-blocking endpoint that creates a background task for heavy computation.
     Returns immediately with a task_id for status checking.
+    A client-supplied task_id acts as an idempotency key: retrying with the
+    same id returns the existing task instead of queueing it again, unless
+    the earlier attempt never reached the broker.
     """
-    task_id = str(uuid.uuid4())
-    
-    # Create task record in database
-    create_task(task_id)
+    if task_id is None:
+        task_id = uuid.uuid4()
     
-    
-    heavy_computation_task.delay(task_id, task_data.data)
+    # Create the task record and queue it for the worker, batched with concurrent requests
+    queued = asyncio.get_running_loop().create_future()
+    _task_queue.put_nowait((task_id, data, queued))
+    task = await queued
+    message = "Task queued for processing"
+    if task is None:
+        task = await get_task(task_id)
+        message = "Task already exists"
+        if task['status'] == "pending" and not task['dispatched']:
+            # An earlier attempt stored the task but its publish failed (or is still
+            # in flight in another worker); publish again so the task runs at least once
+            await asyncio.to_thread(_dispatch_batch, [(task_id, data, None)], set())
+            await _record_dispatched([task_id])
+            message = "Task queued for processing"
     
     return TaskResponse(
-        task_id=task_id,
-        status="pending",
-        message="Task queued for processing"
+        task_id=task['task_id'].hex,
+        status=task['status'],
+        created_at=task['created_at'],
+        message=message
     )
 
 @app.get("/results/{task_id}", response_model=TaskStatusResponse)
-def get_task_status(task_id: str):
+async def get_task_status(task_id: str):
     """
     Get the status and result of a task by task_id.
     """
-    task = get_task(task_id)
-    
-    if not task:
+    try:
+        task_id = uuid.UUID(task_id)
+    except ValueError:
+        # A malformed id can't match any task
         raise HTTPException(status_code=404, detail="Task not found")
     
+    task = _completed_tasks.get(task_id)
+    if task is None:
+        task = await get_task(task_id)
+        if not task:
+            raise HTTPException(status_code=404, detail="Task not found")
+        if task['status'] == "completed":
+            _completed_tasks[task_id] = task
+    
     return TaskStatusResponse(
-        task_id=task['task_id'],
+        task_id=task['task_id'].hex,
         status=task['status'],
         result=task['result'],
         error_message=task['error_message'],
-        created_at=task['created_at'].isoformat() if task['created_at'] else None,
-        completed_at=task['completed_at'].isoformat() if task['completed_at'] else None
+        created_at=task['created_at'],
+        completed_at=task['completed_at']
     )